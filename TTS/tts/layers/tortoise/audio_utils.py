@@ -1,3 +1,4 @@
+import functools
 import os
 from glob import glob
 from typing import Dict, List
@@ -158,7 +159,9 @@ def load_voices(voices: List[str], extra_voice_dirs: List[str] = []):
         return None, latents
 
 
-def wav_to_univnet_mel(wav, do_normalization=False, device="cuda"):
+@functools.lru_cache(maxsize=None)
+def _get_univnet_stft(device):
+    """Build the STFT once per device so the Hann window and the mel filterbank are not recomputed on every call."""
     stft = TorchSTFT(
         n_fft=1024,
         hop_length=256,
@@ -170,6 +173,13 @@ def wav_to_univnet_mel(wav, do_normalization=False, device="cuda"):
         mel_fmax=12000,
     )
     stft = stft.to(device)
+    # the mel basis is a plain attribute, move it too so it is not copied to the device at every call
+    stft.mel_basis = stft.mel_basis.to(device)
+    return stft
+
+
+def wav_to_univnet_mel(wav, do_normalization=False, device="cuda"):
+    stft = _get_univnet_stft(device)
     mel = stft(wav)
     mel = dynamic_range_compression(mel)
     if do_normalization:
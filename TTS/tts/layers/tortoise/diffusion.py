@@ -188,6 +188,10 @@ class GaussianDiffusion:
     :param rescale_timesteps: if True, pass floating point timesteps into the
                               model so that they are always scaled like in the
                               original paper (0 to 1000).
+    :param batch_conditioning_free: if True, compute the conditioned and the
+                                    conditioning free outputs in a single
+                                    model call over a doubled batch. The model
+                                    must accept `batch_conditioning_free=True`.
     """
 
     def __init__(
@@ -201,6 +205,7 @@ class GaussianDiffusion:
         conditioning_free=False,
         conditioning_free_k=1,
         ramp_conditioning_free=True,
+        batch_conditioning_free=False,
         sampler="p",
     ):
         self.sampler = sampler
@@ -211,6 +216,7 @@ class GaussianDiffusion:
         self.conditioning_free = conditioning_free
         self.conditioning_free_k = conditioning_free_k
         self.ramp_conditioning_free = ramp_conditioning_free
+        self.batch_conditioning_free = batch_conditioning_free
 
         # Use float64 for accuracy.
         betas = np.array(betas, dtype=np.float64)
@@ -321,9 +327,16 @@ class GaussianDiffusion:
 
         B, C = x.shape[:2]
         assert t.shape == (B,)
-        model_output = model(x, self._scale_timesteps(t), **model_kwargs)
-        if self.conditioning_free:
-            model_output_no_conditioning = model(x, self._scale_timesteps(t), conditioning_free=True, **model_kwargs)
+        if self.conditioning_free and self.batch_conditioning_free:
+            model_output, model_output_no_conditioning = model(
+                x, self._scale_timesteps(t), batch_conditioning_free=True, **model_kwargs
+            ).chunk(2)
+        else:
+            model_output = model(x, self._scale_timesteps(t), **model_kwargs)
+            if self.conditioning_free:
+                model_output_no_conditioning = model(
+                    x, self._scale_timesteps(t), conditioning_free=True, **model_kwargs
+                )
 
         if self.model_var_type in [ModelVarType.LEARNED, ModelVarType.LEARNED_RANGE]:
             assert model_output.shape == (B, C * 2, *x.shape[2:])
@@ -327,6 +327,7 @@ class DiffusionTts(nn.Module):
         conditioning_latent=None,
         precomputed_aligned_embeddings=None,
         conditioning_free=False,
+        batch_conditioning_free=False,
         return_code_pred=False,
     ):
         """
@@ -338,7 +339,8 @@ class DiffusionTts(nn.Module):
         :param conditioning_latent: a pre-computed conditioning latent; see get_conditioning().
         :param precomputed_aligned_embeddings: Embeddings returned from self.timestep_independent()
         :param conditioning_free: When set, all conditioning inputs (including tokens and conditioning_input) will not be considered.
-        :return: an [N x C x ...] Tensor of outputs.
+        :param batch_conditioning_free: When set, the batch is doubled to compute the conditioned outputs and the conditioning free outputs in a single pass. The conditioning free outputs are the second half of the outputs.
+        :return: an [N x C x ...] Tensor of outputs, [2N x C x ...] if batch_conditioning_free is set.
         """
         assert precomputed_aligned_embeddings is not None or (
             aligned_conditioning is not None and conditioning_latent is not None
@@ -346,6 +348,7 @@ class DiffusionTts(nn.Module):
         assert not (
             return_code_pred and precomputed_aligned_embeddings is not None
         )  # These two are mutually exclusive.
+        assert not (return_code_pred and batch_conditioning_free)  # mel_pred is only computed for the conditioned half.
 
         unused_params = []
         if conditioning_free:
@@ -366,7 +369,12 @@ class DiffusionTts(nn.Module):
                 else:
                     unused_params.extend(list(self.latent_conditioner.parameters()))
 
-            unused_params.append(self.unconditioned_embedding)
+            if batch_conditioning_free:
+                code_emb = torch.cat([code_emb, self.unconditioned_embedding.repeat(x.shape[0], 1, x.shape[-1])])
+                x = torch.cat([x, x])
+                timesteps = torch.cat([timesteps, timesteps])
+            else:
+                unused_params.append(self.unconditioned_embedding)
 
         time_emb = self.time_embed(timestep_embedding(timesteps, self.model_channels))
         code_emb = self.conditioning_timestep_integrator(code_emb, time_emb)
@@ -7,9 +7,10 @@ import random
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from transformers import GPT2Config
+from transformers import GPT2Config, LogitsProcessorList
+from transformers.pytorch_utils import Conv1D
 
-from TTS.tts.layers.xtts.gpt_inference import GPT2InferenceModel
+from TTS.tts.layers.xtts.gpt_inference import FusedTopKTopPLogitsWarper, GPT2InferenceModel
 from TTS.tts.layers.xtts.latent_encoder import ConditioningEncoder
 from TTS.tts.layers.xtts.perceiver_encoder import PerceiverResampler
 
@@ -18,6 +19,36 @@ def null_position_embeddings(range, dim):
     return torch.zeros((range.shape[0], range.shape[1], dim), device=range.device)
 
 
+def sdpa_attention(attn, query, key, value, attention_mask=None, head_mask=None):
+    """Drop-in for `GPT2Attention._attn` using the fused `F.scaled_dot_product_attention` kernels at inference.
+
+    The attention matrix is never materialized, so the attention weights are not returned. Training, head masking and
+    layer-wise scaling keep the original implementation.
+    """
+    if attn.training or head_mask is not None or attn.scale_attn_by_inverse_layer_idx or attn.is_cross_attention:
+        return type(attn)._attn(attn, query, key, value, attention_mask, head_mask)
+    query_length, key_length = query.size(-2), key.size(-2)
+    is_causal = attention_mask is None and query_length == key_length
+    if not is_causal and query_length > 1:
+        # queries attend to the cached keys and to the causal part of the new ones. Like the eager implementation, the
+        # padding mask is added on top of the causal one, so rows that only see padded keys are normalized the same way
+        causal_mask = attn.bias[:, :, key_length - query_length : key_length, :key_length]
+        zero = torch.zeros((), dtype=query.dtype, device=query.device)
+        causal_bias = torch.where(causal_mask, zero, torch.finfo(query.dtype).min)
+        attention_mask = causal_bias if attention_mask is None else causal_bias + attention_mask.to(query.dtype)
+    elif attention_mask is not None:
+        attention_mask = attention_mask.to(query.dtype)
+    attn_output = F.scaled_dot_product_attention(
+        query,
+        key,
+        value,
+        attn_mask=attention_mask,
+        is_causal=is_causal,
+        scale=None if attn.scale_attn_weights else 1.0,
+    )
+    return attn_output, None
+
+
 class LearnedPositionEmbeddings(nn.Module):
     def __init__(self, seq_len, model_dim, init=0.02, relative=False):
         super().__init__()
@@ -36,8 +67,9 @@ class LearnedPositionEmbeddings(nn.Module):
         else:
             return self.emb(torch.arange(0, sl, device=x.device))
 
-    def get_fixed_embedding(self, ind, dev):
-        return self.emb(torch.tensor([ind], device=dev)).unsqueeze(0)
+    def get_fixed_embedding(self, ind, dev):  # pylint: disable=unused-argument
+        # index the weight directly to avoid allocating and copying an index tensor to `dev` at every decoding step
+        return self.emb.weight[ind].view(1, 1, -1)
 
 
 def build_hf_gpt_transformer(
@@ -133,6 +165,7 @@ class GPT(nn.Module):
         self.max_text_tokens = -1 if max_text_tokens == -1 else max_text_tokens + 2
         self.max_prompt_tokens = max_prompt_tokens
         self.code_stride_len = code_stride_len
+        self.int8_quantized = False
         self.conditioning_encoder = ConditioningEncoder(80, model_dim, num_attn_heads=heads)
         self.conditioning_dropout = nn.Dropout1d(0.1)
         self.average_conditioning_embeddings = average_conditioning_embeddings
@@ -195,7 +228,7 @@ class GPT(nn.Module):
             "heads": list(self.text_head.parameters()) + list(self.mel_head.parameters()),
         }
 
-    def init_gpt_for_inference(self, kv_cache=True, use_deepspeed=False):
+    def init_gpt_for_inference(self, kv_cache=True, use_deepspeed=False, kv_cache_dtype=None):
         seq_length = self.max_prompt_tokens + self.max_mel_tokens + self.max_text_tokens + 1
         gpt_config = GPT2Config(
             vocab_size=self.max_mel_tokens,
@@ -215,8 +248,11 @@ class GPT(nn.Module):
             self.final_norm,
             self.mel_head,
             kv_cache=kv_cache,
+            kv_cache_dtype=kv_cache_dtype,
         )
         self.gpt.wte = self.mel_embedding
+        for block in self.gpt.h:
+            block.attn._attn = functools.partial(sdpa_attention, block.attn)
 
         if use_deepspeed:
             import deepspeed
@@ -230,6 +266,30 @@ class GPT(nn.Module):
             )
             self.gpt_inference = self.ds_engine.module.eval()
 
+    def quantize_int8(self):
+        """Quantize the linear layers to int8 with dynamic activation quantization, for CPU inference.
+
+        The HF GPT-2 blocks use `Conv1D` layers, which are linear layers with transposed weights, so they are first
+        replaced by `nn.Linear` for `quantize_dynamic` to pick them up. The layers are swapped in place so the
+        inference model built by `init_gpt_for_inference` uses them as well. The resulting state dict is not
+        compatible with the checkpoints anymore. The quantized layers only run on CPU, so the model has to stay there.
+        """
+        self.check_int8_device(next(self.parameters()).device)
+        for module in list(self.gpt.modules()):
+            for name, child in module.named_children():
+                if isinstance(child, Conv1D):
+                    linear = nn.Linear(child.weight.shape[0], child.nf)
+                    linear.weight.data = child.weight.data.t().contiguous()
+                    linear.bias.data = child.bias.data
+                    setattr(module, name, linear)
+        torch.ao.quantization.quantize_dynamic(self, {nn.Linear}, dtype=torch.qint8, inplace=True)
+        self.int8_quantized = True
+
+    def check_int8_device(self, device):
+        """Raise if the model is, or is being, quantized to int8 while running on a device other than the CPU."""
+        if device.type != "cpu":
+            raise RuntimeError(f" ❗ int8 quantization is only supported on CPU, but the GPT runs on {device}.")
+
     def set_inputs_and_targets(self, input, start_token, stop_token):
         inp = F.pad(input, (1, 0), value=start_token)
         tar = F.pad(input, (0, 1), value=stop_token)
@@ -325,10 +385,11 @@ class GPT(nn.Module):
         if self.training:
             lengths = []
             # Compute the real prompt length based on the first encounter with the token 83 used for padding
-            for i in range(prompt_codes.shape[0]):
+            # The codes are copied to the host once instead of reading back every token from the device
+            for codes in prompt_codes.tolist():
                 length = 0
-                for j in range(prompt_codes.shape[1]):
-                    if prompt_codes[i, j] == 83:
+                for code in codes:
+                    if code == 83:
                         break
                     else:
                         length += 1
@@ -580,26 +641,68 @@ class GPT(nn.Module):
         gpt_inputs[:, -1] = self.start_audio_token
         return gpt_inputs
 
+    def fuse_sampling_warpers(self, hf_generate_kwargs):
+        """
+        Replace the HF temperature, top-k and top-p warpers by a single `FusedTopKTopPLogitsWarper` for multinomial
+        sampling. Beam sampling adds the beam scores before warping, so it keeps the HF warpers.
+        """
+        if not hf_generate_kwargs.get("do_sample", False) or hf_generate_kwargs.get("num_beams", 1) != 1:
+            return hf_generate_kwargs
+        generation_config = self.gpt_inference.generation_config
+        warper = FusedTopKTopPLogitsWarper(
+            temperature=hf_generate_kwargs.pop("temperature", generation_config.temperature),
+            top_k=hf_generate_kwargs.pop("top_k", generation_config.top_k),
+            top_p=hf_generate_kwargs.pop("top_p", generation_config.top_p),
+        )
+        # custom processors run after the default ones (e.g. repetition penalty), like the warpers they replace
+        logits_processor = LogitsProcessorList(hf_generate_kwargs.get("logits_processor") or [])
+        logits_processor.append(warper)
+        hf_generate_kwargs.update(logits_processor=logits_processor, temperature=1.0, top_k=0, top_p=1.0)
+        return hf_generate_kwargs
+
     def generate(
         self,
         cond_latents,
         text_inputs,
+        return_latent=False,
         **hf_generate_kwargs,
     ):
+        """
+        If return_latent is specified, the latents of the generated codes are returned together with the codes. They
+        are taken from the transformer output of each decoding step, so no extra forward pass is needed. Only the last
+        position of each step is kept, instead of the hidden states of every layer that `output_hidden_states` would
+        hold on to. It is only valid without beam search since beams are reordered between decoding steps.
+        """
         gpt_inputs = self.compute_embeddings(cond_latents, text_inputs)
-        gen = self.gpt_inference.generate(
-            gpt_inputs,
-            bos_token_id=self.start_audio_token,
-            pad_token_id=self.stop_audio_token,
-            eos_token_id=self.stop_audio_token,
-            max_length=self.max_gen_mel_tokens + gpt_inputs.shape[-1],
-            **hf_generate_kwargs,
-        )
+        hf_generate_kwargs = self.fuse_sampling_warpers(hf_generate_kwargs)
+        latents = []
+        hook = None
+        if return_latent:
+            # the transformer output of each decoding step is the latent that predicted the generated code
+            hook = self.gpt_inference.transformer.register_forward_hook(
+                lambda module, inputs, outputs: latents.append(outputs[0][:, -1:].clone())
+            )
+        try:
+            gen = self.gpt_inference.generate(
+                gpt_inputs,
+                bos_token_id=self.start_audio_token,
+                pad_token_id=self.stop_audio_token,
+                eos_token_id=self.stop_audio_token,
+                max_length=self.max_gen_mel_tokens + gpt_inputs.shape[-1],
+                **hf_generate_kwargs,
+            )
+        finally:
+            if hook is not None:
+                hook.remove()
+        if return_latent:
+            codes = gen.sequences if "return_dict_in_generate" in hf_generate_kwargs else gen
+            return codes[:, gpt_inputs.shape[1] :], self.final_norm(torch.cat(latents, dim=1))
         if "return_dict_in_generate" in hf_generate_kwargs:
             return gen.sequences[:, gpt_inputs.shape[1] :], gen
         return gen[:, gpt_inputs.shape[1] :]
 
     def get_generator(self, fake_inputs, **hf_generate_kwargs):
+        hf_generate_kwargs = self.fuse_sampling_warpers(hf_generate_kwargs)
         return self.gpt_inference.generate_stream(
             fake_inputs,
             bos_token_id=self.start_audio_token,
@@ -609,3 +712,43 @@ class GPT(nn.Module):
             do_stream=True,
             **hf_generate_kwargs,
         )
+
+    def decode_stream(self, fake_inputs, do_sample=True, temperature=1.0, top_k=0, top_p=1.0, repetition_penalty=1.0):
+        """
+        Streaming decoder specialized for a single sequence without beam search. It yields the same
+        `(next_tokens, latent)` pairs as `get_generator` but runs the KV cached forward passes in a plain loop, skipping
+        the generic HF `generate` setup and per step processor dispatch.
+        """
+        assert self.gpt_inference.kv_cache, "decode_stream requires the KV cache."
+        assert fake_inputs.shape[0] == 1, "decode_stream only supports a single sequence."
+        max_length = self.max_gen_mel_tokens + fake_inputs.shape[-1]
+        attention_mask = torch.ones((1, max_length), dtype=torch.long, device=fake_inputs.device)
+        # the repetition penalty applies once to every token already in the sequence, prompt included
+        seen_tokens = torch.zeros((1, self.num_audio_tokens), dtype=torch.bool, device=fake_inputs.device)
+        seen_tokens.scatter_(1, fake_inputs, True)
+        warper = FusedTopKTopPLogitsWarper(temperature=temperature, top_k=top_k, top_p=top_p)
+
+        input_ids, past_key_values = fake_inputs, None
+        for cur_len in range(fake_inputs.shape[-1], max_length):
+            outputs = self.gpt_inference(
+                input_ids=input_ids,
+                past_key_values=past_key_values,
+                attention_mask=attention_mask[:, :cur_len],
+                use_cache=True,
+                output_hidden_states=True,
+                return_dict=True,
+            )
+            scores = outputs.logits[:, -1, :]
+            if repetition_penalty != 1.0:
+                penalized = torch.where(scores < 0, scores * repetition_penalty, scores / repetition_penalty)
+                scores = torch.where(seen_tokens, penalized, scores)
+            if do_sample:
+                next_tokens = torch.multinomial(warper(input_ids, scores).softmax(dim=-1), num_samples=1).squeeze(1)
+            else:
+                next_tokens = scores.argmax(dim=-1)
+            yield next_tokens, self.final_norm(outputs.hidden_states[-1][:, -1])
+            if next_tokens.item() == self.stop_audio_token:
+                break
+            seen_tokens.scatter_(1, next_tokens[:, None], True)
+            input_ids = next_tokens[:, None]
+            past_key_values = outputs.past_key_values
@@ -1,15 +1,44 @@
+import contextlib
 import math
 
 import torch
 from torch import nn
-from transformers import GPT2PreTrainedModel
+from transformers import GPT2PreTrainedModel, LogitsProcessor
 from transformers.modeling_outputs import CausalLMOutputWithCrossAttentions
 
 
+class FusedTopKTopPLogitsWarper(LogitsProcessor):
+    """Apply temperature, top-k and top-p filtering in one pass.
+
+    The HF warpers sort the whole vocabulary for top-p filtering. Here the top-p filter is computed on the already
+    sorted `torch.topk` scores, so only `top_k` values are normalized and accumulated at every decoding step.
+    """
+
+    def __init__(self, temperature=1.0, top_k=0, top_p=1.0, filter_value=-float("inf"), min_tokens_to_keep=1):
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.filter_value = filter_value
+        self.min_tokens_to_keep = min_tokens_to_keep
+
+    def __call__(self, input_ids, scores):
+        if self.temperature != 1.0:
+            scores = scores / self.temperature
+        top_k = scores.shape[-1] if not self.top_k else min(max(self.top_k, self.min_tokens_to_keep), scores.shape[-1])
+        top_scores, top_indices = scores.topk(top_k, dim=-1)
+        if self.top_p < 1.0:
+            top_probs = top_scores.softmax(dim=-1)
+            # remove the tokens whose higher ranked tokens already have top_p probability mass
+            to_remove = (top_probs.cumsum(dim=-1) - top_probs) >= self.top_p
+            to_remove[..., : self.min_tokens_to_keep] = False
+            top_scores = top_scores.masked_fill(to_remove, self.filter_value)
+        return torch.full_like(scores, self.filter_value).scatter_(-1, top_indices, top_scores)
+
+
 class GPT2InferenceModel(GPT2PreTrainedModel):
     """Override GPT2LMHeadModel to allow for prefix conditioning."""
 
-    def __init__(self, config, gpt, pos_emb, embeddings, norm, linear, kv_cache):
+    def __init__(self, config, gpt, pos_emb, embeddings, norm, linear, kv_cache, kv_cache_dtype=None):
         super().__init__(config)
         self.transformer = gpt
         self.pos_embedding = pos_emb
@@ -17,6 +46,7 @@ class GPT2InferenceModel(GPT2PreTrainedModel):
         self.final_norm = norm
         self.lm_head = nn.Sequential(norm, linear)
         self.kv_cache = kv_cache
+        self.kv_cache_dtype = kv_cache_dtype
 
     def store_prefix_emb(self, prefix_emb):
         self.cached_prefix_emb = prefix_emb
@@ -94,20 +124,28 @@ class GPT2InferenceModel(GPT2PreTrainedModel):
             emb = emb + self.pos_embedding.get_fixed_embedding(
                 attention_mask.shape[1] - (prefix_len + 1), attention_mask.device
             )
-        transformer_outputs = self.transformer(
-            inputs_embeds=emb,
-            past_key_values=past_key_values,
-            attention_mask=attention_mask,
-            token_type_ids=token_type_ids,
-            position_ids=position_ids,
-            head_mask=head_mask,
-            encoder_hidden_states=encoder_hidden_states,
-            encoder_attention_mask=encoder_attention_mask,
-            use_cache=use_cache,
-            output_attentions=output_attentions,
-            output_hidden_states=output_hidden_states,
-            return_dict=return_dict,
-        )
+        # the attention projections run in kv_cache_dtype, so the cached keys and values are stored in it as well. The
+        # final layer norm runs in float32 under autocast, so the outputs keep the precision of the lm head. Without a
+        # kv_cache_dtype no context is entered, so an outer autocast context (e.g. `use_autocast`) still applies.
+        if self.kv_cache_dtype is not None and emb.device.type == "cuda":
+            kv_cache_context = torch.autocast(device_type="cuda", dtype=self.kv_cache_dtype)
+        else:
+            kv_cache_context = contextlib.nullcontext()
+        with kv_cache_context:
+            transformer_outputs = self.transformer(
+                inputs_embeds=emb,
+                past_key_values=past_key_values,
+                attention_mask=attention_mask,
+                token_type_ids=token_type_ids,
+                position_ids=position_ids,
+                head_mask=head_mask,
+                encoder_hidden_states=encoder_hidden_states,
+                encoder_attention_mask=encoder_attention_mask,
+                use_cache=use_cache,
+                output_attentions=output_attentions,
+                output_hidden_states=output_hidden_states,
+                return_dict=return_dict,
+            )
         hidden_states = transformer_outputs[0]
         lm_logits = self.lm_head(hidden_states)
 
@@ -3,6 +3,17 @@ import torch
 class SpeakerManager():
     def __init__(self, speaker_file_path=None):
         self.speakers = torch.load(speaker_file_path)
+        self.pinned = False
+
+    def pin_memory(self):
+        """Pin the speaker latents once, so their per request copies to the GPU can run asynchronously."""
+        if self.pinned:
+            return
+        self.speakers = {
+            name: {key: value.pin_memory() if torch.is_tensor(value) else value for key, value in speaker.items()}
+            for name, speaker in self.speakers.items()
+        }
+        self.pinned = True
 
     @property
     def name_to_id(self):
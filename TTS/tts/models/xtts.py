@@ -1,11 +1,16 @@
+import contextlib
+import functools
+import hashlib
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
-import librosa
 import torch
 import torch.nn.functional as F
 import torchaudio
 from coqpit import Coqpit
+from safetensors import SafetensorError, safe_open
+from safetensors.torch import load_file, save_file
 
 from TTS.tts.layers.xtts.gpt import GPT
 from TTS.tts.layers.xtts.hifigan_decoder import HifiDecoder
@@ -17,6 +22,83 @@ from TTS.utils.io import load_fsspec
 
 init_stream_support()
 
+KV_CACHE_DTYPES = {"bf16": torch.bfloat16, "fp16": torch.float16}
+
+
+@functools.lru_cache(maxsize=None)
+def _get_mel_stft(device, n_fft, hop_length, win_length, sample_rate, n_mels, f_min, f_max, power, normalized):
+    """Build the cloning mel transform once per parameter set and device instead of on every call."""
+    return torchaudio.transforms.MelSpectrogram(
+        n_fft=n_fft,
+        hop_length=hop_length,
+        win_length=win_length,
+        power=power,
+        normalized=normalized,
+        sample_rate=sample_rate,
+        f_min=f_min,
+        f_max=f_max,
+        n_mels=n_mels,
+        norm="slaney",
+    ).to(device)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_mel_norms(mel_norms_file, device):
+    return torch.load(mel_norms_file, map_location=device)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_resampler(orig_freq, new_freq, device):
+    """Build the resampling kernel once per sample rate pair and device instead of on every call."""
+    return torchaudio.transforms.Resample(orig_freq=orig_freq, new_freq=new_freq).to(device)
+
+
+def resample(audio, orig_freq, new_freq):
+    """Same as `torchaudio.functional.resample` with default settings but reuses the resampling kernel."""
+    return _get_resampler(orig_freq, new_freq, audio.device)(audio)
+
+
+def checkpoint_fingerprint(path):
+    """Identify the content of a checkpoint file. Stored in the metadata of its cache to detect stale caches.
+
+    The mtime alone is not enough since copies that preserve timestamps (`cp -p`, tar, rsync) can replace a checkpoint
+    with an older one, so the whole file is hashed.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(functools.partial(f.read, 1 << 23), b""):
+            digest.update(block)
+    stat = os.stat(path)
+    return {
+        "source_size": str(stat.st_size),
+        "source_mtime_ns": str(stat.st_mtime_ns),
+        "source_hash": digest.hexdigest(),
+    }
+
+
+def is_state_dict_cache_valid(path, fingerprint):
+    """Check that a cache saved by `save_state_dict_cache` was created from a checkpoint with the given fingerprint."""
+    try:
+        with safe_open(path, framework="pt") as f:
+            metadata = f.metadata() or {}
+    except (OSError, SafetensorError):
+        return False
+    # the mtime is informative only, the same content with a new mtime still matches
+    return all(metadata.get(key) == fingerprint[key] for key in ("source_size", "source_hash"))
+
+
+def save_state_dict_cache(state_dict, path, metadata=None):
+    """Save a state dict as a safetensors file, tensors sharing memory (e.g. tied weights) are stored as copies."""
+    storages = set()
+    tensors = {}
+    for key, tensor in state_dict.items():
+        storage = tensor.untyped_storage().data_ptr()
+        tensors[key] = tensor.clone() if storage in storages else tensor.contiguous()
+        storages.add(storage)
+    # write to a temporary file first so an interrupted save never leaves a truncated cache behind
+    save_file(tensors, path + ".tmp", metadata=metadata)
+    os.replace(path + ".tmp", path)
+
 
 def wav_to_mel_cloning(
     wav,
@@ -45,23 +127,14 @@ def wav_to_mel_cloning(
     Returns:
         torch.Tensor: Mel-spectrogram tensor.
     """
-    mel_stft = torchaudio.transforms.MelSpectrogram(
-        n_fft=n_fft,
-        hop_length=hop_length,
-        win_length=win_length,
-        power=power,
-        normalized=normalized,
-        sample_rate=sample_rate,
-        f_min=f_min,
-        f_max=f_max,
-        n_mels=n_mels,
-        norm="slaney",
-    ).to(device)
+    mel_stft = _get_mel_stft(
+        torch.device(device), n_fft, hop_length, win_length, sample_rate, n_mels, f_min, f_max, power, normalized
+    )
     wav = wav.to(device)
     mel = mel_stft(wav)
     mel = torch.log(torch.clamp(mel, min=1e-5))
     if mel_norms is None:
-        mel_norms = torch.load(mel_norms_file, map_location=device)
+        mel_norms = _load_mel_norms(mel_norms_file, torch.device(device))
     mel = mel / mel_norms.unsqueeze(0).unsqueeze(-1)
     return mel
 
@@ -77,7 +150,7 @@ def load_audio(audiopath, sampling_rate):
         audio = torch.mean(audio, dim=0, keepdim=True)
 
     if lsr != sampling_rate:
-        audio = torchaudio.functional.resample(audio, lsr, sampling_rate)
+        audio = resample(audio, lsr, sampling_rate)
 
     # Check some assumptions about audio range. This should be automatically fixed in load_wav_to_torch, but might not be in some edge cases, where we should squawk.
     # '10' is arbitrarily chosen since it seems like audio will often "overdrive" the [-1,1] bounds.
@@ -88,6 +161,31 @@ def load_audio(audiopath, sampling_rate):
     return audio
 
 
+def trim_silence(audio, top_db, frame_length=2048, hop_length=512):
+    """
+    Trim leading and trailing silence from an audio tensor. It follows `librosa.effects.trim` but keeps the audio on
+    its device instead of going through numpy.
+
+    Args:
+        audio (torch.Tensor): The input audio tensor with time as the last dimension.
+        top_db (float): The threshold (in decibels) below the loudest frame to consider as silence.
+        frame_length (int): The number of samples per analysis frame. Defaults to 2048.
+        hop_length (int): The number of samples between analysis frames. Defaults to 512.
+
+    Returns:
+        torch.Tensor: The trimmed audio tensor.
+    """
+    padded = F.pad(audio, (frame_length // 2, frame_length // 2))
+    frames = padded.unfold(-1, frame_length, hop_length)
+    # frame power aggregated over everything but the time dimension
+    power = frames.pow(2).mean(dim=-1).reshape(-1, frames.shape[-2]).amax(dim=0).clamp(min=1e-10)
+    non_silent = torch.nonzero(power > power.max() * 10 ** (-top_db / 10)).squeeze(-1)
+    if non_silent.numel() == 0:
+        return audio[..., :0]
+    first_frame, last_frame = non_silent[[0, -1]].tolist()
+    return audio[..., first_frame * hop_length : min(audio.shape[-1], (last_frame + 1) * hop_length)]
+
+
 def pad_or_truncate(t, length):
     """
     Ensure a given tensor t has a specified sequence length by either padding it with zeros or clipping it.
@@ -133,6 +231,19 @@ class XttsArgs(Coqpit):
         clvp_checkpoint (str, optional): The checkpoint for the ConditionalLatentVariablePerseq model. Defaults to None.
         decoder_checkpoint (str, optional): The checkpoint for the DiffTTS model. Defaults to None.
         num_chars (int, optional): The maximum number of characters to generate. Defaults to 255.
+        use_autocast (bool, optional): Whether to run GPT decoding and vocoding under BF16 autocast (FP16 on GPUs
+            without BF16 support) at inference. Only applies on CUDA devices. Defaults to False.
+        use_torch_compile (bool, optional): Whether to compile the GPT transformer and the HiFiGAN generator with
+            `torch.compile` when loading the model for inference. Defaults to False.
+        kv_cache_dtype (str, optional): Precision of the GPT KV cache at inference, `"bf16"` or `"fp16"`. The GPT
+            transformer runs under autocast with this dtype, so the cached keys and values take half the memory. Only
+            applies on CUDA devices. Defaults to None (the model precision).
+        quantize_int8 (bool, optional): Whether to quantize the GPT linear layers to int8 with dynamic quantization
+            when loading the model for inference. Only supported for CPU inference, loading or running the quantized
+            model on another device raises an error. Defaults to False.
+        cache_checkpoint (bool, optional): Whether to cache the converted checkpoint as a safetensors file next to a
+            local `model.pth`, so later loads skip unpickling and key conversion. The cache is keyed by the size and a
+            hash of the checkpoint, which is read once per load to validate it. Defaults to False.
 
         For GPT model:
         gpt_max_audio_tokens (int, optional): The maximum mel tokens for the autoregressive model. Defaults to 604.
@@ -157,6 +268,11 @@ class XttsArgs(Coqpit):
     clvp_checkpoint: str = None
     decoder_checkpoint: str = None
     num_chars: int = 255
+    use_autocast: bool = False
+    use_torch_compile: bool = False
+    kv_cache_dtype: str = None
+    quantize_int8: bool = False
+    cache_checkpoint: bool = False
 
     # XTTS GPT Encoder params
     tokenizer_file: str = ""
@@ -214,6 +330,7 @@ class Xtts(BaseTTS):
         self.gpt = None
         self.init_models()
         self.register_buffer("mel_stats", torch.ones(80))
+        self._fade_in_ramps = {}
 
     def init_models(self):
         """Initialize the models. We do it here since we need to load the tokenizer first."""
@@ -254,6 +371,16 @@ class Xtts(BaseTTS):
     def device(self):
         return next(self.parameters()).device
 
+    def autocast_context(self):
+        """Return the mixed precision context used for GPT decoding and vocoding at inference.
+
+        When `use_autocast` is off no context is entered, so an autocast context opened by the caller still applies.
+        """
+        if not (self.args.use_autocast and self.device.type == "cuda"):
+            return contextlib.nullcontext()
+        dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        return torch.autocast(device_type="cuda", dtype=dtype)
+
     @torch.inference_mode()
     def get_gpt_cond_latents(self, audio, sr, length: int = 30, chunk_length: int = 6):
         """Compute the conditioning latents for the GPT model from the given audio.
@@ -266,7 +393,7 @@ class Xtts(BaseTTS):
                 is being used without chunking. It must be < `length`. Defaults to 6.
         """
         if sr != 22050:
-            audio = torchaudio.functional.resample(audio, sr, 22050)
+            audio = resample(audio, sr, 22050)
         if length > 0:
             audio = audio[:, : 22050 * length]
         if self.args.gpt_use_perceiver_resampler:
@@ -280,7 +407,8 @@ class Xtts(BaseTTS):
 
                 mel_chunk = wav_to_mel_cloning(
                     audio_chunk,
-                    mel_norms=self.mel_stats.cpu(),
+                    mel_norms=self.mel_stats,
+                    device=self.device,
                     n_fft=2048,
                     hop_length=256,
                     win_length=1024,
@@ -291,7 +419,7 @@ class Xtts(BaseTTS):
                     f_max=8000,
                     n_mels=80,
                 )
-                style_emb = self.gpt.get_style_emb(mel_chunk.to(self.device), None)
+                style_emb = self.gpt.get_style_emb(mel_chunk, None)
                 style_embs.append(style_emb)
 
             # mean style embedding
@@ -299,7 +427,8 @@ class Xtts(BaseTTS):
         else:
             mel = wav_to_mel_cloning(
                 audio,
-                mel_norms=self.mel_stats.cpu(),
+                mel_norms=self.mel_stats,
+                device=self.device,
                 n_fft=4096,
                 hop_length=1024,
                 win_length=4096,
@@ -310,12 +439,12 @@ class Xtts(BaseTTS):
                 f_max=8000,
                 n_mels=80,
             )
-            cond_latent = self.gpt.get_style_emb(mel.to(self.device))
+            cond_latent = self.gpt.get_style_emb(mel)
         return cond_latent.transpose(1, 2)
 
     @torch.inference_mode()
     def get_speaker_embedding(self, audio, sr):
-        audio_16k = torchaudio.functional.resample(audio, sr, 16000)
+        audio_16k = resample(audio, sr, 16000)
         return (
             self.hifigan_decoder.speaker_encoder.forward(audio_16k.to(self.device), l2_norm=True)
             .unsqueeze(-1)
@@ -353,20 +482,31 @@ class Xtts(BaseTTS):
         speaker_embeddings = []
         audios = []
         speaker_embedding = None
-        for file_path in audio_paths:
-            audio = load_audio(file_path, load_sr)
-            audio = audio[:, : load_sr * max_ref_length].to(self.device)
+        # load the references concurrently since decoding and resampling release the GIL
+        with ThreadPoolExecutor() as executor:
+            loaded_audios = list(executor.map(functools.partial(load_audio, sampling_rate=load_sr), audio_paths))
+
+        device = self.device
+        for audio in loaded_audios:
+            audio = audio[:, : load_sr * max_ref_length]
+            if device.type == "cuda":
+                # copy from pinned memory so the transfer does not block the host
+                audio = audio.pin_memory().to(device, non_blocking=True)
+            else:
+                audio = audio.to(device)
             if sound_norm_refs:
                 audio = (audio / torch.abs(audio).max()) * 0.75
             if librosa_trim_db is not None:
-                audio = librosa.effects.trim(audio, top_db=librosa_trim_db)[0]
-
-            # compute latents for the decoder
-            speaker_embedding = self.get_speaker_embedding(audio, load_sr)
-            speaker_embeddings.append(speaker_embedding)
+                audio = trim_silence(audio, top_db=librosa_trim_db)
 
             audios.append(audio)
 
+        # compute latents for the decoder in as few batches as possible. Zero padding would change the speaker
+        # encoder's instance norm and attentive pooling, so only references of the same length are batched together.
+        for length in dict.fromkeys(audio.shape[-1] for audio in audios):
+            same_length_audios = torch.cat([audio for audio in audios if audio.shape[-1] == length], dim=0)
+            speaker_embeddings.append(self.get_speaker_embedding(same_length_audios, load_sr))
+
         # merge all the audios and compute the latents for the gpt
         full_audio = torch.cat(audios, dim=-1)
         gpt_cond_latents = self.get_gpt_cond_latents(
@@ -374,8 +514,8 @@ class Xtts(BaseTTS):
         )  # [1, 1024, T]
 
         if speaker_embeddings:
-            speaker_embedding = torch.stack(speaker_embeddings)
-            speaker_embedding = speaker_embedding.mean(dim=0)
+            speaker_embedding = torch.cat(speaker_embeddings)
+            speaker_embedding = speaker_embedding.mean(dim=0, keepdim=True)
 
         return gpt_cond_latents, speaker_embedding
 
@@ -408,6 +548,8 @@ class Xtts(BaseTTS):
         }
         settings.update(kwargs)  # allow overriding of preset settings with kwargs
         if speaker_id is not None:
+            if self.device.type == "cuda":
+                self.speaker_manager.pin_memory()
             gpt_cond_latent, speaker_embedding = self.speaker_manager.speakers[speaker_id].values()
             return self.inference(text, language, gpt_cond_latent, speaker_embedding, **settings)
         settings.update({
@@ -499,6 +641,26 @@ class Xtts(BaseTTS):
             **hf_generate_kwargs,
         )
 
+    def preprocess_text(self, text, language):
+        """Tokenize a single sentence for the GPT model.
+
+        Args:
+            text (str): Input sentence.
+            language (str): Language ID of the sentence without the country code.
+
+        Returns:
+            torch.Tensor: Text tokens of shape [1, T] on the model device.
+        """
+        text = text.strip().lower()
+        text_tokens = torch.as_tensor(
+            self.tokenizer.encode(text, lang=language), dtype=torch.int32, device=self.device
+        ).unsqueeze(0)
+
+        assert (
+            text_tokens.shape[-1] < self.args.gpt_max_text_tokens
+        ), " ❗ XTTS can only generate text with a maximum of 400 tokens."
+        return text_tokens
+
     @torch.inference_mode()
     def inference(
         self,
@@ -516,12 +678,15 @@ class Xtts(BaseTTS):
         num_beams=1,
         speed=1.0,
         enable_text_splitting=False,
+        to_numpy=True,
         **hf_generate_kwargs,
     ):
         language = language.split("-")[0]  # remove the country code
         length_scale = 1.0 / max(speed, 0.05)
-        gpt_cond_latent = gpt_cond_latent.to(self.device)
-        speaker_embedding = speaker_embedding.to(self.device)
+        if self.gpt.int8_quantized:
+            self.gpt.check_int8_device(self.device)
+        gpt_cond_latent = gpt_cond_latent.to(self.device, non_blocking=True)
+        speaker_embedding = speaker_embedding.to(self.device, non_blocking=True)
         if enable_text_splitting:
             text = split_sentence(text, language, self.tokenizer.char_limits[language])
         else:
@@ -530,17 +695,15 @@ class Xtts(BaseTTS):
         wavs = []
         gpt_latents_list = []
         for sent in text:
-            sent = sent.strip().lower()
-            text_tokens = torch.IntTensor(self.tokenizer.encode(sent, lang=language)).unsqueeze(0).to(self.device)
-
-            assert (
-                text_tokens.shape[-1] < self.args.gpt_max_text_tokens
-            ), " ❗ XTTS can only generate text with a maximum of 400 tokens."
+            text_tokens = self.preprocess_text(sent, language)
 
-            with torch.no_grad():
-                gpt_codes = self.gpt.generate(
+            with self.autocast_context():
+                # reuse the latents computed while decoding unless beam search reorders them
+                reuse_latents = num_beams == 1
+                gpt_out = self.gpt.generate(
                     cond_latents=gpt_cond_latent,
                     text_inputs=text_tokens,
+                    return_latent=reuse_latents,
                     input_tokens=None,
                     do_sample=do_sample,
                     top_p=top_p,
@@ -553,59 +716,78 @@ class Xtts(BaseTTS):
                     output_attentions=False,
                     **hf_generate_kwargs,
                 )
-                expected_output_len = torch.tensor(
-                    [gpt_codes.shape[-1] * self.gpt.code_stride_len], device=text_tokens.device
-                )
+                if reuse_latents:
+                    gpt_codes, gpt_latents = gpt_out
+                else:
+                    gpt_codes = gpt_out
+                    expected_output_len = torch.tensor(
+                        [gpt_codes.shape[-1] * self.gpt.code_stride_len], device=text_tokens.device
+                    )
 
-                text_len = torch.tensor([text_tokens.shape[-1]], device=self.device)
-                gpt_latents = self.gpt(
-                    text_tokens,
-                    text_len,
-                    gpt_codes,
-                    expected_output_len,
-                    cond_latents=gpt_cond_latent,
-                    return_attentions=False,
-                    return_latent=True,
-                )
+                    text_len = torch.tensor([text_tokens.shape[-1]], device=self.device)
+                    gpt_latents = self.gpt(
+                        text_tokens,
+                        text_len,
+                        gpt_codes,
+                        expected_output_len,
+                        cond_latents=gpt_cond_latent,
+                        return_attentions=False,
+                        return_latent=True,
+                    )
 
                 if length_scale != 1.0:
                     gpt_latents = F.interpolate(
                         gpt_latents.transpose(1, 2), scale_factor=length_scale, mode="linear"
                     ).transpose(1, 2)
 
-                gpt_latents_list.append(gpt_latents.cpu())
-                wavs.append(self.hifigan_decoder(gpt_latents, g=speaker_embedding).cpu().squeeze())
+                gpt_latents_list.append(gpt_latents.float())
+                wavs.append(self.hifigan_decoder(gpt_latents, g=speaker_embedding).float().squeeze())
 
+        # outputs stay on the model device unless numpy arrays are requested, so there is a single device sync at most
+        wav = torch.cat(wavs, dim=0)
+        gpt_latents = torch.cat(gpt_latents_list, dim=1)
+        if to_numpy:
+            wav = wav.cpu().numpy()
+            gpt_latents = gpt_latents.cpu().numpy()
         return {
-            "wav": torch.cat(wavs, dim=0).numpy(),
-            "gpt_latents": torch.cat(gpt_latents_list, dim=1).numpy(),
+            "wav": wav,
+            "gpt_latents": gpt_latents,
             "speaker_embedding": speaker_embedding,
         }
 
-    def handle_chunks(self, wav_gen, wav_gen_prev, wav_overlap, overlap_len):
-        """Handle chunk formatting in streaming mode"""
+    def get_fade_in_ramp(self, overlap_len, device, dtype):
+        """Return the cached 0 -> 1 crossfade ramp for the given overlap length, device and dtype."""
+        key = (overlap_len, device, dtype)
+        if key not in self._fade_in_ramps:
+            self._fade_in_ramps[key] = torch.linspace(0.0, 1.0, overlap_len, device=device, dtype=dtype)
+        return self._fade_in_ramps[key]
+
+    def handle_chunks(self, wav_gen, wav_gen_prev_len, wav_overlap, overlap_len):
+        """Handle chunk formatting in streaming mode.
+
+        ``wav_gen_prev_len`` is the number of samples of the previous ``wav_gen`` (0 for the first chunk), every
+        returned chunk is a view into ``wav_gen`` so no audio is copied between steps.
+        """
         wav_chunk = wav_gen[:-overlap_len]
-        if wav_gen_prev is not None:
-            wav_chunk = wav_gen[(wav_gen_prev.shape[0] - overlap_len) : -overlap_len]
+        if wav_gen_prev_len > 0:
+            wav_chunk = wav_gen[(wav_gen_prev_len - overlap_len) : -overlap_len]
         if wav_overlap is not None:
             # cross fade the overlap section
             if overlap_len > len(wav_chunk):
                 # wav_chunk is smaller than overlap_len, pass on last wav_gen
-                if wav_gen_prev is not None:
-                    wav_chunk = wav_gen[(wav_gen_prev.shape[0] - overlap_len) :]
+                if wav_gen_prev_len > 0:
+                    wav_chunk = wav_gen[(wav_gen_prev_len - overlap_len) :]
                 else:
                     # not expecting will hit here as problem happens on last chunk
                     wav_chunk = wav_gen[-overlap_len:]
-                return wav_chunk, wav_gen, None
+                return wav_chunk, wav_gen.shape[0], None
             else:
-                crossfade_wav = wav_chunk[:overlap_len]
-                crossfade_wav = crossfade_wav * torch.linspace(0.0, 1.0, overlap_len).to(crossfade_wav.device)
-                wav_chunk[:overlap_len] = wav_overlap * torch.linspace(1.0, 0.0, overlap_len).to(wav_overlap.device)
-                wav_chunk[:overlap_len] += crossfade_wav
+                # fade out the previous overlap while fading in the new chunk in a single fused op
+                fade_in = self.get_fade_in_ramp(overlap_len, wav_chunk.device, wav_chunk.dtype)
+                wav_chunk[:overlap_len] = torch.lerp(wav_overlap, wav_chunk[:overlap_len], fade_in)
 
         wav_overlap = wav_gen[-overlap_len:]
-        wav_gen_prev = wav_gen
-        return wav_chunk, wav_gen_prev, wav_overlap
+        return wav_chunk, wav_gen.shape[0], wav_overlap
 
     @torch.inference_mode()
     def inference_stream(
@@ -630,65 +812,86 @@ class Xtts(BaseTTS):
     ):
         language = language.split("-")[0]  # remove the country code
         length_scale = 1.0 / max(speed, 0.05)
-        gpt_cond_latent = gpt_cond_latent.to(self.device)
-        speaker_embedding = speaker_embedding.to(self.device)
+        # `self.device` looks up the parameters, resolve it and the vocoder autocast context once per call
+        device = self.device
+        vocoder_autocast = self.autocast_context()
+        if self.gpt.int8_quantized:
+            self.gpt.check_int8_device(device)
+        if gpt_cond_latent.device != device:
+            gpt_cond_latent = gpt_cond_latent.to(device, non_blocking=True)
+        # moved once here, the decoder reuses the device tensor for every chunk of every sentence
+        if speaker_embedding.device != device:
+            speaker_embedding = speaker_embedding.to(device, non_blocking=True)
         if enable_text_splitting:
             text = split_sentence(text, language, self.tokenizer.char_limits[language])
         else:
             text = [text]
 
         for sent in text:
-            sent = sent.strip().lower()
-            text_tokens = torch.IntTensor(self.tokenizer.encode(sent, lang=language)).unsqueeze(0).to(self.device)
-
-            assert (
-                text_tokens.shape[-1] < self.args.gpt_max_text_tokens
-            ), " ❗ XTTS can only generate text with a maximum of 400 tokens."
+            text_tokens = self.preprocess_text(sent, language)
 
             fake_inputs = self.gpt.compute_embeddings(
-                gpt_cond_latent.to(self.device),
+                gpt_cond_latent,
                 text_tokens,
             )
-            gpt_generator = self.gpt.get_generator(
-                fake_inputs=fake_inputs,
-                top_k=top_k,
-                top_p=top_p,
-                temperature=temperature,
-                do_sample=do_sample,
-                num_beams=1,
-                num_return_sequences=1,
-                length_penalty=float(length_penalty),
-                repetition_penalty=float(repetition_penalty),
-                output_attentions=False,
-                output_hidden_states=True,
-                **hf_generate_kwargs,
-            )
+            if hf_generate_kwargs or not self.gpt.gpt_inference.kv_cache:
+                gpt_generator = self.gpt.get_generator(
+                    fake_inputs=fake_inputs,
+                    top_k=top_k,
+                    top_p=top_p,
+                    temperature=temperature,
+                    do_sample=do_sample,
+                    num_beams=1,
+                    num_return_sequences=1,
+                    length_penalty=float(length_penalty),
+                    repetition_penalty=float(repetition_penalty),
+                    output_attentions=False,
+                    output_hidden_states=True,
+                    **hf_generate_kwargs,
+                )
+            else:
+                # length_penalty only affects beam search, so the specialized decoder can ignore it
+                gpt_generator = self.gpt.decode_stream(
+                    fake_inputs,
+                    do_sample=do_sample,
+                    temperature=temperature,
+                    top_k=top_k,
+                    top_p=top_p,
+                    repetition_penalty=float(repetition_penalty),
+                )
 
-            last_tokens = []
-            all_latents = []
-            wav_gen_prev = None
+            num_chunk_tokens = 0
+            # latents are written in place into a buffer sized for the longest possible generation, it is allocated
+            # from the first latent so it follows the dtype the decoder produces (e.g. half precision with deepspeed)
+            all_latents = None
+            num_latents = 0
+            wav_gen_prev_len = 0
             wav_overlap = None
             is_end = False
 
             while not is_end:
                 try:
-                    x, latent = next(gpt_generator)
-                    last_tokens += [x]
-                    all_latents += [latent]
+                    _, latent = next(gpt_generator)
+                    num_chunk_tokens += 1
+                    if all_latents is None:
+                        all_latents = latent.new_empty((1, self.gpt.max_gen_mel_tokens, latent.shape[-1]))
+                    all_latents[:, num_latents] = latent
+                    num_latents += 1
                 except StopIteration:
                     is_end = True
 
-                if is_end or (stream_chunk_size > 0 and len(last_tokens) >= stream_chunk_size):
-                    gpt_latents = torch.cat(all_latents, dim=0)[None, :]
+                if is_end or (stream_chunk_size > 0 and num_chunk_tokens >= stream_chunk_size):
+                    gpt_latents = all_latents[:, :num_latents]
                     if length_scale != 1.0:
                         gpt_latents = F.interpolate(
                             gpt_latents.transpose(1, 2), scale_factor=length_scale, mode="linear"
                         ).transpose(1, 2)
-                    wav_gen = self.hifigan_decoder(gpt_latents, g=speaker_embedding.to(self.device))
-                    wav_chunk, wav_gen_prev, wav_overlap = self.handle_chunks(
-                        wav_gen.squeeze(), wav_gen_prev, wav_overlap, overlap_wav_len
+                    with vocoder_autocast:
+                        wav_gen = self.hifigan_decoder(gpt_latents, g=speaker_embedding).float()
+                    wav_chunk, wav_gen_prev_len, wav_overlap = self.handle_chunks(
+                        wav_gen.squeeze(), wav_gen_prev_len, wav_overlap, overlap_wav_len
                     )
-                    last_tokens = []
+                    num_chunk_tokens = 0
                     yield wav_chunk
 
     def forward(self):
@@ -707,25 +910,50 @@ class Xtts(BaseTTS):
 
     def eval(self):  # pylint: disable=redefined-builtin
         """Sets the model to evaluation mode. Overrides the default eval() method to also set the GPT model to eval mode."""
-        self.gpt.init_gpt_for_inference()
+        self.gpt.init_gpt_for_inference(kv_cache=self.args.kv_cache, kv_cache_dtype=self.get_kv_cache_dtype())
         super().eval()
 
+    def get_kv_cache_dtype(self):
+        """Return the torch dtype of the GPT KV cache selected by `args.kv_cache_dtype`, None for the model precision."""
+        if self.args.kv_cache_dtype is None:
+            return None
+        if self.args.kv_cache_dtype not in KV_CACHE_DTYPES:
+            raise ValueError(
+                f" [!] Unsupported kv_cache_dtype: {self.args.kv_cache_dtype}, use one of {list(KV_CACHE_DTYPES)}."
+            )
+        return KV_CACHE_DTYPES[self.args.kv_cache_dtype]
+
     def get_compatible_checkpoint_state_dict(self, model_path):
-        checkpoint = load_fsspec(model_path, map_location=torch.device("cpu"))["model"]
+        is_local = os.path.isfile(model_path)
+        cache_path = model_path + ".xtts.safetensors"
+        use_cache = self.args.cache_checkpoint and is_local and not model_path.endswith(".safetensors")
+        fingerprint = checkpoint_fingerprint(model_path) if use_cache else None
+        if use_cache and os.path.isfile(cache_path) and is_state_dict_cache_valid(cache_path, fingerprint):
+            return load_file(cache_path, device="cpu")
+
+        if model_path.endswith(".safetensors"):
+            trainer_checkpoint = load_file(model_path, device="cpu")
+        else:
+            # local checkpoints are memory mapped, the tensors are only read when they are copied into the model
+            trainer_checkpoint = load_fsspec(model_path, map_location=torch.device("cpu"), mmap=is_local)["model"]
         # remove xtts gpt trainer extra keys
-        ignore_keys = ["torch_mel_spectrogram_style_encoder", "torch_mel_spectrogram_dvae", "dvae"]
-        for key in list(checkpoint.keys()):
+        ignore_keys = {"torch_mel_spectrogram_style_encoder", "torch_mel_spectrogram_dvae", "dvae"}
+        checkpoint = {}
+        for key, value in trainer_checkpoint.items():
             # check if it is from the coqui Trainer if so convert it
             if key.startswith("xtts."):
-                new_key = key.replace("xtts.", "")
-                checkpoint[new_key] = checkpoint[key]
-                del checkpoint[key]
-                key = new_key
-
+                key = key[len("xtts.") :]
             # remove unused keys
-            if key.split(".")[0] in ignore_keys:
-                del checkpoint[key]
-
+            if key.split(".", 1)[0] not in ignore_keys:
+                checkpoint[key] = value
+
+        if use_cache:
+            try:
+                save_state_dict_cache(checkpoint, cache_path, metadata=fingerprint)
+            except (OSError, SafetensorError) as e:
+                print(f" > Could not cache the checkpoint to {cache_path}: {e}")
+                if os.path.isfile(cache_path + ".tmp"):
+                    os.remove(cache_path + ".tmp")
         return checkpoint
 
     def load_checkpoint(
@@ -745,7 +973,7 @@ class Xtts(BaseTTS):
         Args:
             config (dict): The configuration dictionary for the model.
             checkpoint_dir (str, optional): The directory where the checkpoint is stored. Defaults to None.
-            checkpoint_path (str, optional): The path to the checkpoint file. Defaults to None.
+            checkpoint_path (str, optional): The path to the checkpoint file, `.pth` or `.safetensors`. Defaults to None.
             vocab_path (str, optional): The path to the vocabulary file. Defaults to None.
             eval (bool, optional): Whether to set the model to evaluation mode. Defaults to True.
             strict (bool, optional): Whether to strictly enforce that the keys in the checkpoint match the keys in the model. Defaults to True.
@@ -762,10 +990,10 @@ class Xtts(BaseTTS):
 
         self.language_manager = LanguageManager(config)
         self.speaker_manager = None
-        if speaker_file_path is not None and os.path.exists(speaker_file_path):
+        if speaker_file_path is not None and os.path.isfile(speaker_file_path):
             self.speaker_manager = SpeakerManager(speaker_file_path)
 
-        if os.path.exists(vocab_path):
+        if os.path.isfile(vocab_path):
             self.tokenizer = VoiceBpeTokenizer(vocab_file=vocab_path)
 
         self.init_models()
@@ -773,17 +1001,38 @@ class Xtts(BaseTTS):
         checkpoint = self.get_compatible_checkpoint_state_dict(model_path)
 
         # deal with v1 and v1.1. V1 has the init_gpt_for_inference keys, v1.1 do not
-        try:
-            self.load_state_dict(checkpoint, strict=strict)
-        except:
-            if eval:
-                self.gpt.init_gpt_for_inference(kv_cache=self.args.kv_cache)
-            self.load_state_dict(checkpoint, strict=strict)
+        gpt_inference_initialized = False
+        if eval and any(key.startswith("gpt.gpt_inference.") for key in checkpoint):
+            self.gpt.init_gpt_for_inference(kv_cache=self.args.kv_cache, kv_cache_dtype=self.get_kv_cache_dtype())
+            gpt_inference_initialized = True
+        self.load_state_dict(checkpoint, strict=strict)
 
         if eval:
             self.hifigan_decoder.eval()
-            self.gpt.init_gpt_for_inference(kv_cache=self.args.kv_cache, use_deepspeed=use_deepspeed)
+            # deepspeed injects its kernels from the loaded weights, so it is only initialized after loading
+            if use_deepspeed or not gpt_inference_initialized:
+                self.gpt.init_gpt_for_inference(
+                    kv_cache=self.args.kv_cache, use_deepspeed=use_deepspeed, kv_cache_dtype=self.get_kv_cache_dtype()
+                )
             self.gpt.eval()
+            if self.args.quantize_int8 and not use_deepspeed:
+                # after the state dict is loaded and the inference model is built, so neither undoes the quantization
+                self.gpt.quantize_int8()
+            if self.args.use_torch_compile:
+                self.compile_for_inference(compile_gpt=not use_deepspeed)
+
+    def compile_for_inference(self, compile_gpt=True):
+        """Compile the GPT transformer and the HiFiGAN generator forwards with `torch.compile`.
+
+        The forwards are replaced in place so the module structure and the state dict keys are untouched. Sequence
+        lengths change at every decoding step and with every input text, so the graphs are compiled with dynamic
+        shapes to avoid recompilations. This also holds for the per chunk vocoder calls of `inference_stream`, which
+        decode the whole latent prefix generated so far and therefore see a new length at every chunk.
+        """
+        if compile_gpt:
+            self.gpt.gpt.forward = torch.compile(self.gpt.gpt.forward, dynamic=True)
+        waveform_decoder = self.hifigan_decoder.waveform_decoder
+        waveform_decoder.forward = torch.compile(waveform_decoder.forward, dynamic=True)
 
     def train_step(self):
         raise NotImplementedError(
@@ -36,7 +36,8 @@ def load_fsspec(
         path: Any path or url supported by fsspec.
         map_location: torch.device or str.
         cache: If True, cache a remote file locally for subsequent calls. It is cached under `get_user_data_dir()/tts_cache`. Defaults to True.
-        **kwargs: Keyword arguments forwarded to torch.load.
+        **kwargs: Keyword arguments forwarded to torch.load. Local files are passed to torch.load by path, so they
+            can be memory mapped with `mmap=True`.
 
     Returns:
         Object stored in path.
@@ -49,6 +50,8 @@ def load_fsspec(
             mode="rb",
         ) as f:
             return torch.load(f, map_location=map_location, **kwargs)
+    elif os.path.isfile(path):
+        return torch.load(path, map_location=map_location, **kwargs)
     else:
         with fsspec.open(path, "rb") as f:
             return torch.load(f, map_location=map_location, **kwargs)
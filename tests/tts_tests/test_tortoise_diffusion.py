@@ -0,0 +1,33 @@
+import unittest
+
+import torch
+
+from TTS.tts.layers.tortoise.diffusion_decoder import DiffusionTts
+from TTS.tts.models.tortoise import load_discrete_vocoder_diffuser
+
+
+class TestBatchConditioningFree(unittest.TestCase):
+    def test_batch_conditioning_free_matches_two_passes(self):
+        torch.manual_seed(0)
+        model = DiffusionTts(
+            model_channels=64,
+            num_layers=2,
+            in_channels=100,
+            in_latent_channels=32,
+            out_channels=200,
+            num_heads=4,
+            layer_drop=0,
+            unconditioned_percentage=0,
+        ).eval()
+        x = torch.randn(2, 100, 24)
+        t = torch.tensor([9, 4])
+        with torch.no_grad():
+            code_emb = model.timestep_independent(torch.randn(2, 12, 32), torch.randn(2, 128), x.shape[-1], False)
+            outputs = [
+                load_discrete_vocoder_diffuser(
+                    desired_diffusion_steps=10, cond_free=True, cond_free_k=2, batch_cond_free=batch_cond_free
+                ).p_mean_variance(model, x, t, model_kwargs={"precomputed_aligned_embeddings": code_emb})
+                for batch_cond_free in (False, True)
+            ]
+        for key in ("mean", "log_variance", "pred_xstart"):
+            self.assertTrue(torch.allclose(outputs[0][key], outputs[1][key], atol=1e-5))
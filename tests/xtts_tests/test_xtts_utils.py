@@ -0,0 +1,207 @@
+import os
+import tempfile
+import unittest
+
+import librosa
+import torch
+import torchaudio
+from transformers import GPT2Config, LogitsProcessorList, TemperatureLogitsWarper, TopKLogitsWarper, TopPLogitsWarper
+from transformers.models.gpt2.modeling_gpt2 import GPT2Attention
+from transformers.pytorch_utils import Conv1D
+
+from tests import get_tests_input_path
+from TTS.tts.layers.xtts.gpt import GPT, sdpa_attention
+from TTS.tts.layers.xtts.gpt_inference import FusedTopKTopPLogitsWarper
+from TTS.tts.models.xtts import (
+    checkpoint_fingerprint,
+    is_state_dict_cache_valid,
+    load_audio,
+    resample,
+    save_state_dict_cache,
+    trim_silence,
+)
+
+WAV_FILE = os.path.join(get_tests_input_path(), "example_1.wav")
+
+
+class TestXttsUtils(unittest.TestCase):
+    @staticmethod
+    def _tiny_gpt():
+        return GPT(
+            start_text_token=28,
+            stop_text_token=0,
+            layers=2,
+            model_dim=64,
+            heads=2,
+            max_text_tokens=20,
+            max_mel_tokens=30,
+            number_text_tokens=30,
+            num_audio_tokens=100,
+            start_audio_token=98,
+            stop_audio_token=99,
+        )
+
+    def test_trim_silence(self):
+        wav = load_audio(WAV_FILE, 22050)
+        # add some silence around the clip so there is something to trim
+        wav = torch.nn.functional.pad(wav, (22050, 22050))
+        for top_db in [20, 60]:
+            expected = librosa.effects.trim(wav.numpy(), top_db=top_db)[0]
+            trimmed = trim_silence(wav, top_db=top_db)
+            self.assertEqual(trimmed.shape, expected.shape)
+            self.assertTrue(torch.allclose(trimmed, torch.from_numpy(expected)))
+
+    def test_trim_silence_all_silent(self):
+        wav = torch.zeros(1, 22050)
+        self.assertEqual(trim_silence(wav, top_db=60).shape, librosa.effects.trim(wav.numpy(), top_db=60)[0].shape)
+
+    def test_resample(self):
+        wav = load_audio(WAV_FILE, 22050)
+        for new_freq in [16000, 24000]:
+            expected = torchaudio.functional.resample(wav, 22050, new_freq)
+            self.assertTrue(torch.allclose(resample(wav, 22050, new_freq), expected, atol=1e-5))
+            # the cached kernel is reused on the next call
+            self.assertTrue(torch.allclose(resample(wav, 22050, new_freq), expected, atol=1e-5))
+
+    def test_fused_top_k_top_p_warper(self):
+        torch.manual_seed(1)
+        scores = torch.randn(2, 8194) * 4
+        for temperature, top_k, top_p in [(0.75, 50, 0.85), (1.0, 0, 0.5), (0.5, 10, 1.0)]:
+            hf_warpers = LogitsProcessorList([TemperatureLogitsWarper(temperature)])
+            if top_k:
+                hf_warpers.append(TopKLogitsWarper(top_k))
+            if top_p < 1.0:
+                hf_warpers.append(TopPLogitsWarper(top_p))
+            expected = hf_warpers(None, scores.clone())
+            warped = FusedTopKTopPLogitsWarper(temperature=temperature, top_k=top_k, top_p=top_p)(None, scores)
+            self.assertTrue(torch.equal(torch.isinf(warped), torch.isinf(expected)))
+            self.assertTrue(torch.allclose(warped[~torch.isinf(warped)], expected[~torch.isinf(expected)]))
+
+    def test_sdpa_attention(self):
+        attn = GPT2Attention(GPT2Config(n_embd=64, n_head=2, n_positions=32)).eval()
+        query, key, value = torch.randn(3, 2, 2, 12, 32).unbind(0)
+        padding_mask = torch.zeros(2, 1, 1, 12)
+        padding_mask[1, ..., :3] = torch.finfo(torch.float32).min
+        # prefill without and with an attention mask, then a single decoding step over the cached keys
+        for q, attention_mask in [(query, None), (query, padding_mask), (query[:, :, -1:], padding_mask)]:
+            expected = attn._attn(q, key, value, attention_mask)[0]
+            self.assertTrue(torch.allclose(sdpa_attention(attn, q, key, value, attention_mask)[0], expected, atol=1e-5))
+
+    def test_decode_stream(self):
+        gpt = self._tiny_gpt()
+        gpt.init_gpt_for_inference()
+        gpt.eval()
+        cond_latents = torch.randn(1, 4, 64)
+        text_tokens = torch.randint(1, 28, (1, 10))
+        sampling_kwargs = {"temperature": 0.75, "top_k": 50, "top_p": 0.85, "do_sample": True}
+        with torch.inference_mode():
+            fake_inputs = gpt.compute_embeddings(cond_latents, text_tokens)
+            torch.manual_seed(1)
+            expected = list(
+                gpt.get_generator(
+                    fake_inputs,
+                    num_beams=1,
+                    repetition_penalty=2.0,
+                    output_hidden_states=True,
+                    **sampling_kwargs,
+                )
+            )
+            torch.manual_seed(1)
+            decoded = list(gpt.decode_stream(fake_inputs, repetition_penalty=2.0, **sampling_kwargs))
+        self.assertEqual(len(decoded), len(expected))
+        for (tokens, latent), (expected_tokens, expected_latent) in zip(decoded, expected):
+            self.assertTrue(torch.equal(tokens, expected_tokens))
+            self.assertTrue(torch.allclose(latent, expected_latent, atol=1e-5))
+
+    def test_generate_return_latent(self):
+        gpt = self._tiny_gpt()
+        gpt.init_gpt_for_inference()
+        gpt.eval()
+        cond_latents = torch.randn(1, 4, 64)
+        text_tokens = torch.randint(1, 28, (1, 10))
+        with torch.inference_mode():
+            codes, latents = gpt.generate(cond_latents, text_tokens, return_latent=True, do_sample=False, num_beams=1)
+            expected = gpt(
+                text_tokens,
+                torch.tensor([text_tokens.shape[-1]]),
+                codes,
+                torch.tensor([codes.shape[-1] * gpt.code_stride_len]),
+                cond_latents=cond_latents,
+                return_latent=True,
+            )
+        self.assertEqual(latents.shape, expected.shape)
+        self.assertTrue(torch.allclose(latents, expected, atol=1e-5))
+
+    def test_quantize_int8(self):
+        gpt = self._tiny_gpt()
+        gpt.init_gpt_for_inference()
+        gpt.eval()
+        cond_latents = torch.randn(1, 4, 64)
+        text_tokens = torch.randint(1, 28, (1, 10))
+        with torch.inference_mode():
+            fake_inputs = gpt.compute_embeddings(cond_latents, text_tokens)
+            expected = gpt.gpt_inference(input_ids=fake_inputs, return_dict=True).logits
+            gpt.quantize_int8()
+            logits = gpt.gpt_inference(input_ids=fake_inputs, return_dict=True).logits
+        self.assertFalse(any(isinstance(module, (Conv1D, torch.nn.Linear)) for module in gpt.gpt.modules()))
+        self.assertTrue(gpt.int8_quantized)
+        with self.assertRaises(RuntimeError):
+            gpt.check_int8_device(torch.device("cuda"))
+        self.assertEqual(logits.shape, expected.shape)
+        self.assertTrue(torch.allclose(logits, expected, atol=0.1))
+
+    @unittest.skipUnless(torch.cuda.is_available(), "requires CUDA")
+    def test_quantize_int8_rejects_cuda(self):
+        gpt = self._tiny_gpt().cuda()
+        gpt.init_gpt_for_inference()
+        with self.assertRaises(RuntimeError):
+            gpt.quantize_int8()
+        self.assertFalse(gpt.int8_quantized)
+
+    def test_kv_cache_dtype_keeps_outer_autocast_state(self):
+        gpt = self._tiny_gpt()
+        gpt.init_gpt_for_inference(kv_cache_dtype=None)
+        gpt.eval()
+        with torch.inference_mode():
+            fake_inputs = gpt.compute_embeddings(torch.randn(1, 4, 64), torch.randint(1, 28, (1, 10)))
+        autocast_states = []
+        gpt.gpt.register_forward_pre_hook(lambda module, args: autocast_states.append(torch.is_autocast_enabled()))
+        # the CUDA autocast flag is thread local state, it can be set without a GPU and does not affect CPU ops
+        prev_autocast_state = torch.is_autocast_enabled()
+        torch.set_autocast_enabled(True)
+        try:
+            with torch.inference_mode():
+                gpt.gpt_inference(input_ids=fake_inputs, return_dict=True)
+        finally:
+            torch.set_autocast_enabled(prev_autocast_state)
+        # without a kv_cache_dtype the transformer must run under the caller's autocast state
+        self.assertEqual(autocast_states, [True])
+
+    @unittest.skipUnless(torch.cuda.is_available(), "requires CUDA")
+    def test_kv_cache_dtype_keeps_outer_autocast(self):
+        dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        gpt = self._tiny_gpt().cuda()
+        gpt.init_gpt_for_inference(kv_cache_dtype=None)
+        gpt.eval()
+        cond_latents = torch.randn(1, 4, 64, device="cuda")
+        text_tokens = torch.randint(1, 28, (1, 10), device="cuda")
+        with torch.inference_mode(), torch.autocast(device_type="cuda", dtype=dtype):
+            fake_inputs = gpt.compute_embeddings(cond_latents, text_tokens)
+            outputs = gpt.gpt_inference(input_ids=fake_inputs, use_cache=True, return_dict=True)
+        # without a kv_cache_dtype the outer autocast context decides the precision of the cached keys and values
+        self.assertEqual(outputs.past_key_values[0][0].dtype, dtype)
+        self.assertEqual(outputs.past_key_values[0][1].dtype, dtype)
+
+    def test_state_dict_cache_fingerprint(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model_path = os.path.join(tmp_dir, "model.pth")
+            cache_path = model_path + ".xtts.safetensors"
+            torch.save({"model": {"weight": torch.ones(4)}}, model_path)
+            fingerprint = checkpoint_fingerprint(model_path)
+            save_state_dict_cache({"weight": torch.ones(4)}, cache_path, metadata=fingerprint)
+            self.assertTrue(is_state_dict_cache_valid(cache_path, checkpoint_fingerprint(model_path)))
+            # a different checkpoint with the same size and an older mtime must not reuse the cache
+            stat = os.stat(model_path)
+            torch.save({"model": {"weight": torch.zeros(4)}}, model_path)
+            os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**9))
+            self.assertFalse(is_state_dict_cache_valid(cache_path, checkpoint_fingerprint(model_path)))